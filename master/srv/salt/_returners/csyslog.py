@@ -71,6 +71,7 @@ except ImportError:
 # Import Salt libs
 import salt.utils.jid
 import salt.utils.json
+import salt.utils.stringutils
 import salt.returners
 from salt.ext import six
 
@@ -137,44 +138,51 @@ def _verify_options(options):
     return True
 
 
-def __virtual__():
-    if not HAS_CSYSLOG:
-        return False, 'Could not import syslog returner; csyslog is not installed.'
-    return __virtualname__
-
-
-def returner(ret):
+def _send(options, data):
     '''
-    Return data to the local syslog
+    Send data to the local syslog using the verified options
     '''
-
-    _options = _get_options(ret)
-
-    if not _verify_options(_options):
-        return
-
     # Get values from syslog module
-    level = getattr(syslog, _options['level'])
-    facility = getattr(syslog, _options['facility'])
+    level = getattr(syslog, options['level'])
+    facility = getattr(syslog, options['facility'])
 
     # parse for syslog options
     logoption = 0
-    for opt in _options['options']:
+    for opt in options['options']:
         logoption = logoption | getattr(syslog, opt)
 
     # Open syslog correctly based on options and tag
-    if 'tag' in _options:
-        syslog.openlog(ident=salt.utils.stringutils.to_str(_options['tag']), logoption=logoption)
+    if 'tag' in options:
+        syslog.openlog(ident=salt.utils.stringutils.to_str(options['tag']), logoption=logoption)
     else:
         syslog.openlog(logoption=logoption)
 
     # Send log of given level and facility
-    syslog.syslog(facility | level, salt.utils.json.dumps(ret))
+    syslog.syslog(facility | level, salt.utils.json.dumps(data))
 
     # Close up to reset syslog to defaults
     syslog.closelog()
 
 
+def __virtual__():
+    if not HAS_CSYSLOG:
+        return False, 'Could not import syslog returner; csyslog is not installed.'
+    return __virtualname__
+
+
+def returner(ret):
+    '''
+    Return data to the local syslog
+    '''
+
+    _options = _get_options(ret)
+
+    if not _verify_options(_options):
+        return
+
+    _send(_options, ret)
+
+
 def prep_jid(nocache=False,
              passed_jid=None):  # pylint: disable=unused-argument
     '''
@@ -192,26 +200,7 @@ def save_load(jid, load, minions=None):
     if not _verify_options(_options):
         return
 
-    # Get values from syslog module
-    level = getattr(syslog, _options['level'])
-    facility = getattr(syslog, _options['facility'])
-
-    # parse for syslog options
-    logoption = 0
-    for opt in _options['options']:
-        logoption = logoption | getattr(syslog, opt)
-
-    # Open syslog correctly based on options and tag
-    if 'tag' in _options:
-        syslog.openlog(ident=salt.utils.stringutils.to_str(_options['tag']), logoption=logoption)
-    else:
-        syslog.openlog(logoption=logoption)
-
-    # Send log of given level and facility
-    syslog.syslog(facility | level, salt.utils.json.dumps({}))
-
-    # Close up to reset syslog to defaults
-    syslog.closelog()
+    _send(_options, {})
 
 def get_load(jid):
   ret = { "": { "": { "fun_args": [], "jid": "19700101000000000000", "return":"","retcode": 0,"success": "","cmd": "_return","_stamp":"1970-01-01T00:00:00.000000", "fun": "", "id":""  }}}
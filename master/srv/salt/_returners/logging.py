@@ -11,10 +11,22 @@ The following fields can be set in the minion conf file::
     logging.remote_port (optional, Default: 514)
     logging.remote_ip (optional, Default: '127.0.0.1')
     logging.logger_name (optional, Default: 'Salt-Master')
+    logging.tcp_timeout (optional, Default: 5)
+When the minion runs jobs in threads (``multiprocessing: False``),
+sending happens on a background thread and returner() only queues the
+record. With the default ``multiprocessing: True`` every job runs in a
+process that exits right after it, so returner() sends the record
+before returning.
+returner_batch() sends a list of returns over a single TCP connection
+to the same endpoint, framed per RFC 6587 (octet counting), in one
+write. Connecting and writing give up after ``tcp_timeout`` seconds.
 '''
-from __future__ import absolute_import, print_function, unicode_literals
-
 # Import python libs
+import atexit
+import queue
+import socket
+import threading
+import time
 try:
     import logging
     import logging.handlers
@@ -22,34 +34,93 @@ try:
 except ImportError:
     HAS_LOGGING = False
 
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 # Import Salt libs
 import salt.utils.jid
 import salt.utils.json
 import salt.returners
-from salt.ext import six
 
 log = logging.getLogger(__name__)
 # Define the module's virtual name
 __virtualname__ = 'logging'
 
+# (logger_name, remote_ip, remote_port, facility, level) -> (logger, level)
+# The logger name is built from the whole key, so each entry owns its
+# logger
+_HANDLER_CACHE = {}
+_HANDLER_LOCK = threading.Lock()
+# Records queued per endpoint before new returns are dropped
+_QUEUE_SIZE = 10000
+# Seconds between warnings about returns dropped on a full queue
+_DROP_WARN_INTERVAL = 60
+# logging level -> syslog severity
+_SEVERITIES = {logging.DEBUG: 7,
+               logging.INFO: 6,
+               logging.WARNING: 4,
+               logging.ERROR: 3,
+               logging.CRITICAL: 2}
+
+# (remote_ip, remote_port, tcp_timeout) -> TCP sender used by returner_batch()
+_TCP_SENDERS = {}
+
+# (ret_config, ret_kwargs) -> resolved returner options
+_OPTS_CACHE = {}
+
+# (option, check, error) applied in order by _verify_options()
+_VALIDATORS = (
+    ('level', lambda v: _level_value(v) is not None, 'level must be a logging level name'),
+    ('remote_port', lambda v: 0 < (_to_number(int, v) or 0) < 65536, 'remote_port must be a port number'),
+    ('tcp_timeout', lambda v: (_to_number(float, v) or 0) > 0, 'tcp_timeout must be a positive number'),
+    ('tag', lambda v: isinstance(v, str), 'tag must be a string'),
+    ('tag', lambda v: len(v) <= 32, 'tag size is limited to 32 characters'),
+    ('facility', lambda v: _facility_value(v) is not None, 'facility must be a syslog facility name'),
+)
+
 
 def _get_options(ret=None):
     '''
     Get the returner options from salt.
+    Options only depend on the return config and kwargs of ``ret``,
+    so they are resolved once per combination.
+    '''
+    ret_kwargs = (ret or {}).get('ret_kwargs') or {}
+    try:
+        cfg_key = ((ret or {}).get('ret_config'),
+                   frozenset(ret_kwargs.items()))
+    except TypeError:
+        # unhashable kwargs values, resolve without caching
+        return _resolve_options(ret)
+
+    _options = _OPTS_CACHE.get(cfg_key)
+    if _options is None:
+        _options = _OPTS_CACHE.setdefault(cfg_key, _resolve_options(ret))
+    return _options
+
+
+def _resolve_options(ret=None):
+    '''
+    Merge the returner options from the config, pillar and ``ret``.
     '''
 
     defaults = {'level': 'INFO',
                 'facility': 'LOG_USER',
                 'remote_port': 514,
                 'remote_ip': '127.0.0.1',
-                'logger_name': 'Salt-Master'
+                'logger_name': 'Salt-Master',
+                'tcp_timeout': 5
                 }
 
     attrs = {'level': 'level',
              'facility': 'facility',
              'remote_ip': 'remote_ip',
              'remote_port': 'remote_port',
-             'logger_name': 'logger_name'
+             'logger_name': 'logger_name',
+             'tcp_timeout': 'tcp_timeout'
              }
 
     _options = salt.returners.get_returner_options(__virtualname__,
@@ -58,6 +129,11 @@ def _get_options(ret=None):
                                                    __salt__=__salt__,
                                                    __opts__=__opts__,
                                                    defaults=defaults)
+
+    # Resolve the level and facility names once per config
+    _options['_level_int'] = _level_value(_options.get('level'))
+    _options['_facility_int'] = _facility_value(_options.get('facility'))
+    _options['_valid'] = _verify_options(_options)
     return _options
 
 
@@ -68,27 +144,250 @@ def _verify_options(options):
     otherwise False
     '''
 
-    # Sanity check port
-    if 'port' in options:
-        if not isinstance(options['port'], int):
-            log.error('port must be an int')
+    for key, check, error in _VALIDATORS:
+        if key in options and not check(options[key]):
+            log.error('%s, got %r', error, options[key])
             return False
+    return True
 
-    # Sanity check tag
-    if 'tag' in options:
-        if not isinstance(options['tag'], six.string_types):
-            log.error('tag must be a string')
-            return False
-        if len(options['tag']) > 32:
-            log.error('tag size is limited to 32 characters')
-            return False
 
-    return True
+def _to_number(cast, value):
+    '''
+    ``cast(value)``, or None if value cannot be converted
+    '''
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _level_value(level):
+    '''
+    Logging level number for a name such as ``INFO``, or None if it is
+    not a known level
+    '''
+    if isinstance(level, int):
+        return level
+    if isinstance(level, str):
+        value = logging.getLevelName(level)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def _facility_value(name):
+    '''
+    Syslog facility number for a name such as ``LOG_DAEMON``, or None
+    if it is not a known facility
+    '''
+    if not isinstance(name, str):
+        return None
+    name = name.lower()
+    if name.startswith('log_'):
+        name = name[4:]
+    return logging.handlers.SysLogHandler.facility_names.get(name)
+
+
+def _dumps(obj):
+    '''
+    Serialize a return to UTF-8 encoded JSON, with orjson when it is
+    available
+    '''
+    if HAS_ORJSON:
+        try:
+            return orjson.dumps(obj,
+                                default=str,
+                                option=orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # orjson.JSONEncodeError, e.g. integers out of 64-bit range
+            pass
+    return salt.utils.json.dumps(obj).encode('utf-8')
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    '''
+    QueueHandler that enqueues records unformatted: their message is
+    the already serialized JSON bytes, which formatting would turn into
+    a ``b'...'`` repr. Returns dropped on a full queue are counted and
+    reported in one warning per ``_DROP_WARN_INTERVAL`` seconds. Closing
+    it stops its listener, which sends every queued record, then closes
+    the sender behind it.
+    '''
+    listener = None
+    dropped = 0
+    last_warning = 0
+
+    def prepare(self, record):
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            now = time.monotonic()
+            if now - self.last_warning >= _DROP_WARN_INTERVAL:
+                log.warning('syslog queue is full, dropped %s returns',
+                            self.dropped)
+                self.dropped = 0
+                self.last_warning = now
+
+    def close(self):
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.stop()
+            for handler in listener.handlers:
+                handler.close()
+        logging.handlers.QueueHandler.close(self)
+
+
+def _priority(facility, level):
+    '''
+    Syslog PRI value for a facility and a logging level
+    '''
+    return (facility << 3) | _SEVERITIES.get(level, 4)
+
+
+class _SyslogSender(logging.Handler):
+    '''
+    Send each record as a single syslog datagram. Unlike SysLogHandler
+    there are no filters or formatter, and handle() does not take the
+    handler's own lock: the JSON payload goes straight to the socket.
+    The address is resolved once and the socket connected to it, so
+    sends skip per-packet addressing. One socket is enough: records
+    reach the sender either from its endpoint's QueueListener thread
+    or, in a forked job process, from that job alone.
+    '''
+    def __init__(self, address, facility):
+        logging.Handler.__init__(self)
+        family, socktype, proto, _, sockaddr = socket.getaddrinfo(
+            address[0], address[1], 0, socket.SOCK_DGRAM)[0]
+        self.address = sockaddr
+        self.facility = facility
+        self.socket = socket.socket(family, socktype, proto)
+        self.socket.connect(sockaddr)
+        # logging level -> b'<PRI>' header
+        self._prefixes = {}
+
+    def handle(self, record):
+        self.emit(record)
+        return True
+
+    def emit(self, record):
+        try:
+            msg = record.msg
+            if isinstance(msg, bytes):
+                payload = msg
+            else:
+                payload = record.getMessage().encode('utf-8')
+            prefix = self._prefixes.get(record.levelno)
+            if prefix is None:
+                prefix = self._prefixes[record.levelno] = \
+                    b'<%d>' % _priority(self.facility, record.levelno)
+            self.socket.send(b''.join((prefix, payload, b'\x00')))
+        except Exception:
+            # Never let one bad record escape into the QueueListener,
+            # which would kill its thread
+            self.handleError(record)
+
+    def close(self):
+        self.socket.close()
+        logging.Handler.close(self)
+
+
+class _TcpSyslogSender(object):
+    '''
+    Send batches of syslog messages over one TCP connection, using
+    RFC 6587 octet-counting framing. The connection is opened on first
+    use and reopened after a failed write. ``timeout`` bounds both the
+    connect and each write.
+    '''
+    def __init__(self, address, timeout):
+        self.address = address
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.socket = None
+
+    def send_batch(self, pri, payloads):
+        prefix = b'<%d>' % pri
+        buf = bytearray()
+        for payload in payloads:
+            buf += b'%d ' % (len(prefix) + len(payload))
+            buf += prefix
+            buf += payload
+
+        with self.lock:
+            if self.socket is None:
+                self.socket = socket.create_connection(self.address,
+                                                       timeout=self.timeout)
+            try:
+                self.socket.sendall(buf)
+            except OSError:
+                self.socket.close()
+                self.socket = None
+                raise
+
+
+def _get_logger(options):
+    '''
+    Return the ``(logger, level)`` pair bound to the options' syslog
+    endpoint, building and caching its syslog sender on first use.
+    When the minion runs jobs in threads, the logger only enqueues
+    records and a QueueListener thread drains them to the syslog
+    socket. Forked job processes end with ``os._exit``, which would
+    drop whatever is still queued, so there the logger sends
+    synchronously.
+    '''
+    key = (options.get('logger_name'),
+           options.get('remote_ip'),
+           options.get('remote_port'),
+           options.get('facility'),
+           options['_level_int'])
+    entry = _HANDLER_CACHE.get(key)
+    if entry is not None:
+        return entry
+
+    with _HANDLER_LOCK:
+        entry = _HANDLER_CACHE.get(key)
+        if entry is None:
+            # Configure the logger before anything that starts a thread
+            my_logger = logging.getLogger('%s-%s-%s-%s-%s' % key)
+            my_logger.setLevel(key[4])
+            my_logger.propagate = False
+            # A reloaded module finds the previous load's handlers on
+            # the same logger; close them instead of leaking threads,
+            # but never touch a handler this load's cache still uses
+            live = set(live_handler
+                       for cached_logger, _ in _HANDLER_CACHE.values()
+                       for live_handler in cached_logger.handlers)
+            for stale in my_logger.handlers[:]:
+                if stale not in live:
+                    my_logger.removeHandler(stale)
+                    stale.close()
+
+            handler = _SyslogSender((key[1], int(key[2])),
+                                    options['_facility_int'])
+            if __opts__.get('multiprocessing', True):
+                front = handler
+            else:
+                records = queue.Queue(maxsize=_QUEUE_SIZE)
+                listener = logging.handlers.QueueListener(records,
+                                                          handler,
+                                                          respect_handler_level=True)
+                listener.start()
+                front = _QueueHandler(records)
+                front.listener = listener
+                atexit.register(front.close)
+
+            my_logger.addHandler(front)
+            entry = _HANDLER_CACHE[key] = (my_logger, key[4])
+    return entry
 
 
 def __virtual__():
     if not HAS_LOGGING:
         return False, 'Could not import logging returner; logging is not installed.'
+    _OPTS_CACHE.clear()
     return __virtualname__
 
 
@@ -98,23 +397,47 @@ def returner(ret):
     '''
     _options = _get_options(ret)
 
-    if not _verify_options(_options):
+    if not _options['_valid']:
         return
 
-    remote_ip = _options.get('remote_ip')
-    remote_port = _options.get('remote_port')
-    level = logging.getLevelName(_options.get('level'))
+    my_logger, level = _get_logger(_options)
+    # Serialize now: ret may change once we return, before the queued
+    # record is sent
+    my_logger.log(level, _dumps(ret))
+
+
+def returner_batch(rets):
+    '''
+    Return a list of returns to the remote syslog in a single TCP write.
+    The options of the first return apply to the whole batch.
+    '''
+    if not rets:
+        return
+    if len(rets) == 1:
+        return returner(rets[0])
 
-    my_logger = logging.getLogger(_options.get('logger_name'))
-    my_logger.setLevel(level)
+    _options = _get_options(rets[0])
 
-    handler = logging.handlers.SysLogHandler(address = (remote_ip, remote_port))
+    if not _options['_valid']:
+        return
 
-    if not len(my_logger.handlers):
-        my_logger.addHandler(handler)
+    key = (_options.get('remote_ip'),
+           _options.get('remote_port'),
+           float(_options.get('tcp_timeout')))
+    sender = _TCP_SENDERS.get(key)
+    if sender is None:
+        with _HANDLER_LOCK:
+            sender = _TCP_SENDERS.get(key)
+            if sender is None:
+                sender = _TCP_SENDERS[key] = _TcpSyslogSender((key[0], int(key[1])),
+                                                              key[2])
 
-    my_logger.log(level, salt.utils.json.dumps(ret))
-    del my_logger
+    pri = _priority(_options['_facility_int'], _options['_level_int'])
+    try:
+        sender.send_batch(pri, [_dumps(ret) for ret in rets])
+    except OSError as exc:
+        log.error('Could not send %s returns to %s:%s: %s',
+                  len(rets), key[0], key[1], exc)
 
 def prep_jid(nocache=False,
              passed_jid=None):  # pylint: disable=unused-argument